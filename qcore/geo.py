@@ -52,11 +52,18 @@ def get_distances(locations: np.ndarray, lon: Union[float, np.ndarray], lat: Uni
 def closest_location(locations, lon, lat):
     """
     Find position and distance of closest location in 2D np.array of (lon, lat).
-    """
-    d = get_distances(locations, lon, lat)
-    i = np.argmin(d)
-
-    return i, d[i]
+    Locations are ranked by the dot product of their unit vectors with the reference
+    location (the cosine of the central angle), so the haversine is only evaluated
+    for the closest location.
+    """
+    loc_lon, loc_lat = np.radians(np.asarray(locations, dtype=np.float64)[:, :2]).T
+    ref_lon, ref_lat = radians(lon), radians(lat)
+    cos_angle = np.cos(loc_lat) * cos(ref_lat) * np.cos(loc_lon - ref_lon) + np.sin(
+        loc_lat
+    ) * sin(ref_lat)
+    i = np.argmax(cos_angle)
+
+    return i, get_distances(locations[i : i + 1], lon, lat)[0]
 
 
 def ll2gp_multi(
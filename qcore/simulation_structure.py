@@ -2,10 +2,12 @@
 Gives access to the folder structure of the cybershake directory
 """
 import os
+from functools import lru_cache
 
 import qcore.constants as const
 
 
+@lru_cache(maxsize=None)
 def get_fault_from_realisation(realisation):
     realisation = os.path.basename(realisation)  # if realisation is a fullpath
     return realisation.rsplit("_REL",1)[0]
@@ -17,7 +19,7 @@ def get_realisation_name(fault_name, rel_no):
 # VM
 def get_fault_VM_dir(cybershake_root, realisation):
     fault = get_fault_from_realisation(realisation)
-    return os.path.join(get_VM_dir(cybershake_root), fault)
+    return os.path.join(cybershake_root, "Data", "VMs", fault)
 
 
 def get_VM_dir(cybershake_root):
@@ -25,7 +27,13 @@ def get_VM_dir(cybershake_root):
 
 
 def get_vm_params_path(cybershake_root, realisation):
-    return os.path.join(get_fault_VM_dir(cybershake_root, realisation), "vm_params.yaml")
+    return os.path.join(
+        cybershake_root,
+        "Data",
+        "VMs",
+        get_fault_from_realisation(realisation),
+        "vm_params.yaml",
+    )
 
 
 def get_realisation_VM_dir(cybershake_root, realisation):
@@ -79,7 +87,12 @@ def get_srf_dir(cybershake_root, realisation):
 
 def get_srf_path(cybershake_root, realisation):
     return os.path.join(
-        cybershake_root, "Data", "Sources", get_srf_location(realisation)
+        cybershake_root,
+        "Data",
+        "Sources",
+        get_fault_from_realisation(realisation),
+        "Srf",
+        realisation + ".srf",
     )
 
 
@@ -106,7 +119,12 @@ def get_source_params_dir(cybershake_root, realisation):
 
 def get_source_params_path(cybershake_root, realisation):
     return os.path.join(
-        cybershake_root, "Data", "Sources", get_source_params_location(realisation)
+        cybershake_root,
+        "Data",
+        "Sources",
+        get_fault_from_realisation(realisation),
+        "Sim_params",
+        realisation + ".yaml",
     )
 
 
@@ -128,7 +146,12 @@ def get_stoch_dir(cybershake_root, realisation):
 
 def get_stoch_path(cybershake_root, realisation):
     return os.path.join(
-        cybershake_root, "Data", "Sources", get_stoch_location(realisation)
+        cybershake_root,
+        "Data",
+        "Sources",
+        get_fault_from_realisation(realisation),
+        "Stoch",
+        realisation + ".stoch",
     )
 
 
@@ -159,8 +182,7 @@ def get_fault_dir(cybershake_root, fault_name):
 
 def get_sim_dir(cybershake_root, realisation):
     return os.path.join(
-        get_fault_dir(cybershake_root, get_fault_from_realisation(realisation)),
-        realisation,
+        cybershake_root, "Runs", get_fault_from_realisation(realisation), realisation
     )
 
 
@@ -106,3 +106,18 @@ def test_wgs_nztm2000x(test_lonlat, output_points):
     test_points = geo.wgs_nztm2000x(test_lonlat)
     sample_output_points = np.array(output_points)
     utils.compare_np_array(test_points, sample_output_points)
+
+
+@pytest.mark.parametrize(
+    "test_lon, test_lat",
+    [(172.6, -43.5), (174.8, -41.3), (0, 0), (-179.9, -45.0)],
+)
+def test_closest_location(test_lon, test_lat):
+    rng = np.random.default_rng(0)
+    locations = np.column_stack(
+        (rng.uniform(-180, 180, 1000), rng.uniform(-90, 90, 1000))
+    )
+    distances = geo.get_distances(locations, test_lon, test_lat)
+    i, d = geo.closest_location(locations, test_lon, test_lat)
+    assert i == np.argmin(distances)
+    assert d == distances[i]
@@ -0,0 +1,59 @@
+import copy
+import pickle
+
+import pytest
+
+from qcore.utils import DotDictify
+
+
+def test_dotdictify_wraps_nested_dicts_on_init():
+    d = DotDictify({"a": {"b": {"c": 1}}})
+    assert isinstance(d.a, DotDictify)
+    assert isinstance(d.a.b, DotDictify)
+    assert d.a.b.c == d["a"]["b"]["c"] == 1
+
+
+def test_dotdictify_wraps_nested_dicts_on_setattr():
+    d = DotDictify()
+    d.a = {"b": 2}
+    d["c"] = {"d": 3}
+    assert isinstance(d.a, DotDictify)
+    assert isinstance(d.c, DotDictify)
+    assert d == {"a": {"b": 2}, "c": {"d": 3}}
+
+
+def test_dotdictify_missing_keys():
+    d = DotDictify({"a": {}})
+    with pytest.raises(KeyError):
+        d["missing"]
+    with pytest.raises(AttributeError):
+        d.missing
+    with pytest.raises(AttributeError):
+        d.a.missing
+    with pytest.raises(AttributeError):
+        del d.missing
+    # Lookups must not insert placeholders for missing keys
+    assert d == {"a": {}}
+
+
+def test_dotdictify_delattr():
+    d = DotDictify({"a": 1, "b": 2})
+    del d.a
+    assert d == {"b": 2}
+
+
+def test_dotdictify_not_callable():
+    assert not callable(DotDictify())
+
+
+@pytest.mark.parametrize(
+    "round_trip",
+    [lambda d: pickle.loads(pickle.dumps(d)), copy.deepcopy, copy.copy],
+)
+def test_dotdictify_round_trip(round_trip):
+    d = DotDictify({"a": {"b": [1, 2]}, "c": 3})
+    copied = round_trip(d)
+    assert copied == d
+    assert type(copied) is DotDictify
+    assert isinstance(copied.a, DotDictify)
+    assert copied.a.b == [1, 2]
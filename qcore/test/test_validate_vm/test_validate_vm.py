@@ -0,0 +1,407 @@
+import io
+import sys
+
+import matplotlib.path as mpltPath
+import numpy as np
+import pytest
+import yaml
+
+from qcore import validate_vm
+from qcore.constants import VM_PARAMS_FILE_NAME
+from qcore import geo
+from qcore.geo import build_corners
+
+NX, NY, NZ = 20, 30, 4
+SUFX = "_rt01-h0.400"
+VM_ORIGIN = (172.5, -43.5)
+VM_ROT = 30.0
+VM_EXTENT_X, VM_EXTENT_Y = 200.0, 300.0
+
+
+def make_vm_dir(vm_dir):
+    """Writes a minimal valid VM directory, returning its path"""
+    vm_dir.mkdir(parents=True)
+    vm_params = {
+        "MODEL_LON": VM_ORIGIN[0],
+        "MODEL_LAT": VM_ORIGIN[1],
+        "MODEL_ROT": VM_ROT,
+        "hh": 10.0,
+        "nx": NX,
+        "ny": NY,
+        "nz": NZ,
+        "sufx": SUFX,
+        "extent_x": VM_EXTENT_X,
+        "extent_y": VM_EXTENT_Y,
+        "extent_zmax": 40.0,
+        "extent_zmin": 0.0,
+    }
+    with open(vm_dir / VM_PARAMS_FILE_NAME, "w") as vm_params_fp:
+        yaml.safe_dump(vm_params, vm_params_fp)
+    for vm_file in ["vs3dfile.s", "vp3dfile.p", "rho3dfile.d"]:
+        np.ones(NX * NY * NZ, dtype="<f4").tofile(vm_dir / vm_file)
+    for prefix in [
+        "gridout",
+        "gridfile",
+        "model_bounds",
+        "model_coords",
+        "model_params",
+    ]:
+        (vm_dir / f"{prefix}{SUFX}").write_text("")
+    corners = build_corners(VM_ORIGIN, VM_ROT, VM_EXTENT_X, VM_EXTENT_Y)
+    with open(vm_dir / "VeloModCorners.txt", "w") as crns_fp:
+        crns_fp.write(">Velocity model corners\n>Lon Lat\n")
+        for lon, lat in corners:
+            crns_fp.write(f"{lon} {lat}\n")
+    return vm_dir
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["validate_vm.py", *args])
+    return validate_vm.main()
+
+
+def test_validate_vm_files(tmp_path):
+    assert validate_vm.validate_vm_files(make_vm_dir(tmp_path / "vm")) == (True, "")
+
+
+def test_get_vm_batch_single_vm(tmp_path):
+    vm_dir = make_vm_dir(tmp_path / "vm")
+    assert validate_vm._get_vm_batch(vm_dir) == ([vm_dir], [None])
+
+
+def test_get_vm_batch_folder(tmp_path):
+    vm_dirs = [make_vm_dir(tmp_path / name) for name in ["vm_b", "vm_a"]]
+    (tmp_path / "not_a_vm").mkdir()
+    assert validate_vm._get_vm_batch(tmp_path) == (sorted(vm_dirs), [None, None])
+
+
+def test_get_vm_batch_list_file(tmp_path):
+    batch_file = tmp_path / "batch.txt"
+    batch_file.write_text(
+        f"{tmp_path / 'vm_a'} {tmp_path / 'a.srf'}\n\n{tmp_path / 'vm_b'}\n"
+    )
+    assert validate_vm._get_vm_batch(batch_file) == (
+        [tmp_path / "vm_a", tmp_path / "vm_b"],
+        [tmp_path / "a.srf", None],
+    )
+
+
+@pytest.mark.parametrize("batch_name", ["empty_dir", "empty_list.txt"])
+def test_main_empty_batch(tmp_path, monkeypatch, batch_name):
+    batch = tmp_path / batch_name
+    if batch.suffix:
+        batch.write_text("")
+    else:
+        batch.mkdir()
+    with pytest.raises(SystemExit) as e:
+        run_main(monkeypatch, "NZVM", str(batch), "--jobs", "2")
+    assert e.value.code == 2
+
+
+def test_main_jobs_must_be_positive(tmp_path, monkeypatch):
+    with pytest.raises(SystemExit) as e:
+        run_main(monkeypatch, "NZVM", str(tmp_path), "--jobs", "0")
+    assert e.value.code == 2
+
+
+def test_main_batch(tmp_path, monkeypatch, capsys):
+    make_vm_dir(tmp_path / "vms" / "vm_a")
+    bad_vm_dir = make_vm_dir(tmp_path / "vms" / "vm_b")
+    np.zeros(NX * NY * NZ, dtype="<f4").tofile(bad_vm_dir / "vp3dfile.p")
+    assert run_main(monkeypatch, "NZVM", str(tmp_path / "vms"), "--jobs", "2") == 1
+    assert capsys.readouterr().out == (
+        f"{bad_vm_dir}:\n"
+        f"File {bad_vm_dir / 'vp3dfile.p'} has minimum value of 0.0\n"
+    )
+
+
+def test_validate_many_missing_vm_params(tmp_path):
+    vm_dir = make_vm_dir(tmp_path / "vm")
+    missing_vm_dir = tmp_path / "missing"
+    missing_vm_dir.mkdir()
+    assert validate_vm.validate_many([missing_vm_dir, vm_dir], jobs=2) == [
+        (False, f"VM file not found: {missing_vm_dir / VM_PARAMS_FILE_NAME}"),
+        (True, ""),
+    ]
+
+
+def test_validate_vm_file_truncated(tmp_path):
+    vm_file = tmp_path / "vs3dfile.s"
+    values = np.ones(NX * NY * NZ - 10, dtype="<f4")
+    values[-1] = 0
+    values.tofile(vm_file)
+    assert validate_vm.validate_vm_file(vm_file, NX, NY, NZ) == [
+        f"VM filesize for {vm_file} expected: {NX * NY * NZ * 4} found: {values.nbytes}",
+        f"File {vm_file} has minimum value of 0.0",
+    ]
+
+
+def test_validate_vm_file_oversized(tmp_path):
+    vm_file = tmp_path / "vs3dfile.s"
+    values = np.ones(NX * NY * NZ + 10, dtype="<f4")
+    # Values past nx * ny * nz are not part of the model, so are not checked
+    values[-1] = 0
+    values.tofile(vm_file)
+    assert validate_vm.validate_vm_file(vm_file, NX, NY, NZ) == [
+        f"VM filesize for {vm_file} expected: {NX * NY * NZ * 4} found: {values.nbytes}",
+    ]
+
+
+def test_validate_vm_file_positive(tmp_path):
+    vm_file = tmp_path / "vs3dfile.s"
+    np.full(NX * NY * NZ, 0.5, dtype="<f4").tofile(vm_file)
+    assert validate_vm.validate_vm_file(vm_file, NX, NY, NZ) == []
+
+
+def test_validate_vm_file_nan(tmp_path):
+    vm_file = tmp_path / "vs3dfile.s"
+    values = np.ones(NX * NY * NZ, dtype="<f4")
+    values[100] = np.nan
+    values.tofile(vm_file)
+    assert validate_vm.validate_vm_file(vm_file, NX, NY, NZ) == [
+        f"File {vm_file} has minimum value of nan"
+    ]
+
+
+@pytest.mark.parametrize("bad_value", [0.0, -1.5])
+def test_validate_vm_file_last_chunk(tmp_path, monkeypatch, bad_value):
+    # Chunks that do not divide the model size evenly, so the last one is partial
+    monkeypatch.setattr(validate_vm, "SCAN_CHUNK_SIZE", 7)
+    vm_file = tmp_path / "vs3dfile.s"
+    values = np.ones(NX * NY * NZ, dtype="<f4")
+    values[-1] = bad_value
+    values.tofile(vm_file)
+    assert validate_vm.validate_vm_file(vm_file, NX, NY, NZ) == [
+        f"File {vm_file} has minimum value of {bad_value}"
+    ]
+
+
+def get_densified_edges(polygon):
+    """The VM edges sampled with the original per edge np.linspace loop, as a reference for validate_vm"""
+    edges = []
+    for index, start_point in enumerate(polygon):
+        end_point = polygon[(index + 1) % len(polygon)]
+        lons = (
+            np.linspace(
+                start_point[0],
+                end_point[0],
+                int(max(geo.ll_dist(*start_point, *end_point), 3)),
+            )
+            % 360
+        )
+        lats = geo.compute_intermediate_latitudes(start_point, end_point, lons)
+        edges.extend(list(zip(lons, lats)))
+    return np.array(edges)
+
+
+def get_densified_path(polygon):
+    return mpltPath.Path(get_densified_edges(polygon))
+
+
+def get_densified_errors(polygon, srf_bounds):
+    """The srf errors of validate_vm_bounds when every srf is tested against the reference densified edges"""
+    path = get_densified_path(polygon)
+    return [
+        "Srf extents not contained within velocity model corners"
+        for bounds in srf_bounds
+        if not all(path.contains_points(bounds))
+    ]
+
+
+def shift_from_edge(polygon, centre, distance):
+    """
+    Returns the midpoint of each edge of the polygon, shifted distance km towards the centre
+    Negative distances shift away from the centre
+    """
+    points = []
+    for (lon1, lat1), (lon2, lat2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        mid_lon, mid_lat = geo.ll_mid(lon1, lat1, lon2, lat2)
+        bearing = geo.ll_bearing(mid_lon, mid_lat, *centre)
+        lat, lon = geo.ll_shift(mid_lat, mid_lon, distance, bearing)
+        points.append((lon % 360, lat))
+    return points
+
+
+@pytest.mark.parametrize("rot", [0.0, 30.0, 135.0, 250.0])
+@pytest.mark.parametrize(
+    "edge_distance, expect_shortcut, expect_inside",
+    [
+        (20.0, True, True),
+        (validate_vm.CONVEX_VM_MARGIN / 2, False, True),
+        (-validate_vm.CONVEX_VM_MARGIN / 2, False, False),
+        (-20.0, False, False),
+    ],
+)
+def test_validate_vm_bounds_rectangle(
+    rot, edge_distance, expect_shortcut, expect_inside
+):
+    centre = (172.5, -43.5)
+    polygon = [
+        (lon % 360, lat) for lon, lat in build_corners(centre, rot, 150.0, 250.0)
+    ]
+    srf_bounds = [
+        [point] for point in shift_from_edge(polygon, centre, edge_distance)
+    ] + [[centre]]
+
+    expected = get_densified_errors(polygon, srf_bounds)
+    assert validate_vm.validate_vm_bounds(polygon, srf_bounds) == expected
+    assert len(expected) == (0 if expect_inside else 4)
+    assert (
+        validate_vm._inside_convex_vm(np.asarray(polygon), np.concatenate(srf_bounds))
+        == expect_shortcut
+    )
+
+
+@pytest.mark.parametrize(
+    "srf_point, expect_inside",
+    [((170.5, -40.5), True), ((170.5, -41.5), True), ((171.5, -41.5), False)],
+)
+def test_validate_vm_bounds_concave(srf_point, expect_inside):
+    # An L shape, with the notch in the south east
+    polygon = [
+        (170.0, -40.0),
+        (172.0, -40.0),
+        (172.0, -41.0),
+        (171.0, -41.0),
+        (171.0, -42.0),
+        (170.0, -42.0),
+    ]
+    srf_bounds = [[srf_point]]
+
+    expected = get_densified_errors(polygon, srf_bounds)
+    assert validate_vm.validate_vm_bounds(polygon, srf_bounds) == expected
+    assert len(expected) == (0 if expect_inside else 1)
+    assert not validate_vm._inside_convex_vm(
+        np.asarray(polygon), np.concatenate(srf_bounds)
+    )
+
+
+@pytest.mark.parametrize(
+    "srf_point, expect_shortcut, expect_inside",
+    [((180.2, -44.0), True, True), ((-179.8, -44.0), False, False)],
+)
+def test_validate_vm_bounds_antimeridian(srf_point, expect_shortcut, expect_inside):
+    polygon = [
+        (lon % 360, lat)
+        for lon, lat in build_corners((180.0, -44.0), 0.0, 100.0, 100.0)
+    ]
+    srf_bounds = [[srf_point]]
+
+    expected = get_densified_errors(polygon, srf_bounds)
+    assert validate_vm.validate_vm_bounds(polygon, srf_bounds) == expected
+    assert len(expected) == (0 if expect_inside else 1)
+    assert (
+        validate_vm._inside_convex_vm(np.asarray(polygon), np.concatenate(srf_bounds))
+        == expect_shortcut
+    )
+
+
+@pytest.mark.parametrize("rot", [0.0, 30.0, 135.0, 250.0])
+def test_inside_densified_vm(rot):
+    centre = (172.5, -43.5)
+    polygon = [
+        (lon % 360, lat) for lon, lat in build_corners(centre, rot, 150.0, 250.0)
+    ]
+    # A grid of points covering the VM and its surroundings
+    lons, lats = np.meshgrid(
+        np.linspace(centre[0] - 3, centre[0] + 3, 121),
+        np.linspace(centre[1] - 3, centre[1] + 3, 121),
+    )
+    points = np.column_stack((lons.ravel(), lats.ravel()))
+
+    inside = validate_vm._inside_densified_vm(np.asarray(polygon), points)
+    expected = get_densified_path(polygon).contains_points(points)
+    assert expected.any() and not expected.all()
+    assert np.array_equal(inside, expected)
+
+
+@pytest.mark.parametrize(
+    "polygon",
+    [
+        [
+            (lon % 360, lat)
+            for lon, lat in build_corners((172.5, -43.5), rot, 150.0, 250.0)
+        ]
+        for rot in [0.0, 30.0, 135.0, 250.0]
+    ]
+    + [
+        [(179.0, -44.0), (181.0, -44.0), (180.5, -45.0), (179.5, -45.0)],
+        [(170.0, -40.0), (170.01, -40.0), (170.01, -40.01)],
+    ],
+)
+def test_densify_vm_edges(polygon):
+    np.testing.assert_allclose(
+        validate_vm._densify_vm_edges(np.asarray(polygon)),
+        get_densified_edges(polygon),
+        rtol=0,
+        atol=1e-9,
+    )
+
+
+@pytest.mark.parametrize(
+    "srf_bounds, expected",
+    [
+        (None, []),
+        ([], []),
+        (np.array([[(172.5, -43.5)] * 4]), []),
+        (
+            np.array([[(172.5, -43.5)] * 4, [(175.0, -43.5)] * 4]),
+            ["Srf extents not contained within velocity model corners"],
+        ),
+    ],
+)
+def test_validate_vm_bounds_srf_bounds_types(srf_bounds, expected):
+    polygon = build_corners((172.5, -43.5), 30.0, 150.0, 250.0)
+    assert validate_vm.validate_vm_bounds(polygon, srf_bounds) == expected
+
+
+def test_validate_many_missing_srf(tmp_path):
+    vm_dir = make_vm_dir(tmp_path / "vm")
+    srf = tmp_path / "missing.srf"
+    assert validate_vm.validate_many([vm_dir], [srf], jobs=1) == [
+        (False, f"Srf file not found: {srf}")
+    ]
+
+
+@pytest.mark.parametrize(
+    "vm_params_text, expected_error",
+    [("nx: [1, 2\n", "ParserError: "), ("nx: 20\n", "KeyError: 'sufx'")],
+)
+def test_validate_many_malformed_vm_params(tmp_path, vm_params_text, expected_error):
+    vm_dir = make_vm_dir(tmp_path / "vm")
+    bad_vm_dir = make_vm_dir(tmp_path / "bad_vm")
+    (bad_vm_dir / VM_PARAMS_FILE_NAME).write_text(vm_params_text)
+    (bad_valid, bad_message), vm_result = validate_vm.validate_many(
+        [bad_vm_dir, vm_dir], jobs=2
+    )
+    assert not bad_valid
+    assert bad_message.startswith(expected_error)
+    assert vm_result == (True, "")
+
+
+@pytest.mark.skipif(
+    not hasattr(validate_vm.os, "posix_fadvise"), reason="posix_fadvise unavailable"
+)
+def test_validate_vm_file_drops_pages_on_error(tmp_path, monkeypatch):
+    vm_file = tmp_path / "vs3dfile.s"
+    np.ones(NX * NY * NZ, dtype="<f4").tofile(vm_file)
+    advice = []
+    monkeypatch.setattr(
+        validate_vm.os,
+        "posix_fadvise",
+        lambda fd, offset, length, flag: advice.append(flag),
+    )
+
+    class FailingReadFile(io.FileIO):
+        def readinto(self, buffer):
+            raise OSError("read failed")
+
+    monkeypatch.setattr(
+        validate_vm, "open", lambda file, mode: FailingReadFile(file), raising=False
+    )
+    with pytest.raises(OSError):
+        validate_vm.validate_vm_file(vm_file, NX, NY, NZ)
+    assert advice == [
+        validate_vm.os.POSIX_FADV_SEQUENTIAL,
+        validate_vm.os.POSIX_FADV_DONTNEED,
+    ]
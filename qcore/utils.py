@@ -5,22 +5,32 @@ Mostly related to file system operations and other non-specific functionality.
 
 
 import os
-import imp
+import importlib.util
 import yaml
+from importlib.machinery import SourceFileLoader
 from shutil import rmtree
 from collections import OrderedDict
-from collections import Mapping
+from collections.abc import Mapping
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    # PyYAML built without libyaml
+    from yaml import SafeLoader
 
 
 class DotDictify(dict):
     """
     Construct an dictionary object whose values can also be accessed by 'dot'
     eg. d.k; d.k1.k2
+    Item access uses the builtin dict lookup, attribute access is only redirected to it
+    once regular attribute lookup fails. Missing keys raise KeyError/AttributeError.
     """
 
-    MARKER = object()
+    __slots__ = ()
 
     def __init__(self, value=None):
+        super(DotDictify, self).__init__()
         if value is None:
             pass
         elif isinstance(value, dict):
@@ -34,20 +44,19 @@ class DotDictify(dict):
             value = DotDictify(value)
         super(DotDictify, self).__setitem__(key, value)
 
-    def __getitem__(self, key):
-        found = self.get(key, DotDictify.MARKER)
-        if found is DotDictify.MARKER:
-            found = DotDictify()
-            super(DotDictify, self).__setitem__(key, found)
-        return found
-
-    def __call__(self, *args, **kwargs):
-        return self
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key) from None
 
-    def __getstate__(self):
-        return self.__dict__
+    def __delattr__(self, key):
+        try:
+            del self[key]
+        except KeyError:
+            raise AttributeError(key) from None
 
-    __setattr__, __getattr__ = __setitem__, __getitem__
+    __setattr__ = __setitem__
 
 
 def ordered_load(stream, Loader=yaml.Loader, object_pairs_hook=OrderedDict):
@@ -81,7 +90,10 @@ def load_yaml(yaml_file, obj_type=dict):
     :return: OrderedDict/dict
     """
     with open(yaml_file, "r") as stream:
-        return ordered_load(stream, Loader=yaml.SafeLoader, object_pairs_hook=obj_type)
+        if obj_type is dict:
+            # dict preserves insertion order, let the loader build mappings natively
+            return yaml.load(stream, Loader=SafeLoader)
+        return ordered_load(stream, Loader=SafeLoader, object_pairs_hook=obj_type)
 
 
 def ordered_dump(data, stream, Dumper=yaml.Dumper, representer=OrderedDict, **kwds):
@@ -208,11 +220,13 @@ def load_py_cfg(f_path):
     :param f_path: path to configuration file
     :return: dict of parameters
     """
-    with open(f_path) as f:
-        module = imp.load_module("params", f, f_path, (".py", "r", imp.PY_SOURCE))
-        cfg_dict = module.__dict__
+    # explicit loader so files without a .py extension are still accepted
+    loader = SourceFileLoader("params", f_path)
+    spec = importlib.util.spec_from_file_location("params", f_path, loader=loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
 
-    return cfg_dict
+    return vars(module)
 
 
 def compare_versions(version1, version2, split_char="."):
@@ -15,6 +15,9 @@ fi
 """
 
 import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import matplotlib.path as mpltPath
@@ -23,14 +26,23 @@ import numpy as np
 from qcore.utils import load_yaml
 from qcore.constants import VM_PARAMS_FILE_NAME, VMParams
 from qcore.srf import get_bounds
-from qcore.geo import ll_dist, compute_intermediate_latitudes, build_corners
-from qcore.vm_file import VelocityModelFile
+from qcore.geo import (
+    R_EARTH,
+    ll_dist,
+    compute_intermediate_latitudes,
+    build_corners,
+)
+from qcore.vm_file import DISK_DTYPE
 
 SINGLE_FILE_SUB_PARSER = "file"
 NZVM_SUB_PARSER = "NZVM"
 PARAMS_SUB_PARSER = "params"
 
 SIZE_FLOAT = 4
+# Number of floats read per chunk when scanning VM files (16 MiB)
+SCAN_CHUNK_SIZE = 1 << 22
+# Distance (km) SRF points must be inside a convex VM to skip the densified edge test
+CONVEX_VM_MARGIN = 1.0
 
 MIN_LAT = -53
 MAX_LAT = -28
@@ -131,6 +143,9 @@ def validate_vm_files(vm_dir: str, srf: str = None):
         return False, "VM dir is not a directory: {}".format(vm_dir)
 
     # Ensure all required files exist
+    # The other file names depend on the vm_params, so nothing else can be checked without it
+    if not vm_params_file_path.is_file():
+        return False, f"VM file not found: {vm_params_file_path}"
     vm_params_dict = load_yaml(vm_params_file_path)
 
     vm_files = [vm_dir / "vs3dfile.s", vm_dir / "vp3dfile.p", vm_dir / "rho3dfile.d"]
@@ -144,100 +159,288 @@ def validate_vm_files(vm_dir: str, srf: str = None):
         vm_dir / f"model_coords{vm_params_dict['sufx']}",
         vm_dir / f"model_params{vm_params_dict['sufx']}",
     ]
+    # List the directory once rather than checking each file individually
+    with os.scandir(vm_dir) as entries:
+        present_files = {entry.name for entry in entries}
     for vm_file in all_files:
-        if not vm_file.exists():
+        if vm_file.name not in present_files:
             errors.append(f"VM file not found: {vm_file}")
 
     # Check binary file sizes for files that exist
-    for file_path in vm_files:
-        # Test all files we can, so we get all the problems at once
-        if file_path.exists():
-            errors.extend(
-                validate_vm_file(
-                    file_path,
-                    vm_params_dict[VMParams.nx.value],
-                    vm_params_dict[VMParams.ny.value],
-                    vm_params_dict[VMParams.nz.value],
-                )
-            )
-
-    if vel_crns_file.exists():
-        polygon = []
-        with open(vel_crns_file) as crns_fp:
-            next(crns_fp)
-            next(crns_fp)
-            for line in crns_fp:
-                lon, lat = map(float, line.split())
-                lon = lon % 360
-                polygon.append((lon, lat))
-        if srf is not None:
+    # Test all files we can, so we get all the problems at once
+    # The files are independent, so reading one overlaps with scanning another
+    existing_vm_files = [
+        file_path for file_path in vm_files if file_path.name in present_files
+    ]
+    if existing_vm_files:
+        with ThreadPoolExecutor(max_workers=len(existing_vm_files)) as executor:
+            for file_errors in executor.map(
+                partial(
+                    validate_vm_file,
+                    nx=vm_params_dict[VMParams.nx.value],
+                    ny=vm_params_dict[VMParams.ny.value],
+                    nz=vm_params_dict[VMParams.nz.value],
+                ),
+                existing_vm_files,
+            ):
+                errors.extend(file_errors)
+
+    if vel_crns_file.name in present_files:
+        polygon = np.loadtxt(vel_crns_file, skiprows=2, usecols=(0, 1), ndmin=2)
+        polygon[:, 0] %= 360
+        if srf is not None and Path(srf).is_file():
             srf_bounds = get_bounds(srf)
         else:
             srf_bounds = None
         errors.extend(validate_vm_bounds(polygon, srf_bounds))
 
+    if srf is not None and not Path(srf).is_file():
+        errors.append(f"Srf file not found: {srf}")
+
     if errors:
         return False, "\n".join(errors)
     return True, ""
 
 
+def validate_many(vm_dirs, srfs=None, jobs=None):
+    """
+    Validates the files of many VM directories in parallel worker processes
+    :param vm_dirs: A list of paths to VM directories
+    :param srfs: A list of srf paths, one per VM directory, entries may be None. Not used if not given
+    :param jobs: The number of worker processes. Defaults to the number of cpus
+    :return: A list of (bool, string) results from validate_vm_files, in the same order as vm_dirs
+    """
+    if srfs is None:
+        srfs = [None] * len(vm_dirs)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(_validate_batch_vm_files, vm_dirs, srfs))
+
+
+def _validate_batch_vm_files(vm_dir, srf=None):
+    """
+    Validates one VM of a batch, reporting any error raised (e.g. from a malformed vm_params file)
+    as a failure of that VM, so the rest of the batch still gets validated
+    """
+    try:
+        return validate_vm_files(vm_dir, srf)
+    except Exception as e:
+        return False, f"{type(e).__name__}: {e}"
+
+
+def _get_vm_batch(vm_batch: Path):
+    """
+    Finds the VMs to validate in batch mode
+    :param vm_batch: Either a VM directory, a directory containing VM directories, or a file listing one VM directory
+    per line, optionally followed by the path to the srf to check it against
+    :return: A list of VM directories and a list of their srfs
+    """
+    if (vm_batch / VM_PARAMS_FILE_NAME).exists():
+        return [vm_batch], [None]
+
+    if vm_batch.is_dir():
+        vm_dirs = sorted(
+            vm_dir
+            for vm_dir in vm_batch.iterdir()
+            if (vm_dir / VM_PARAMS_FILE_NAME).exists()
+        )
+        return vm_dirs, [None] * len(vm_dirs)
+
+    vm_dirs, srfs = [], []
+    with open(vm_batch) as batch_fp:
+        for line in batch_fp:
+            parts = line.split()
+            if not parts:
+                continue
+            vm_dirs.append(Path(parts[0]))
+            srfs.append(Path(parts[1]) if len(parts) > 1 else None)
+    return vm_dirs, srfs
+
+
+def _ll_to_unit_vectors(lon_lat):
+    """Converts an (n, 2) array of (lon, lat) degrees to an (n, 3) array of unit vectors"""
+    lon, lat = np.radians(lon_lat).T
+    return np.column_stack(
+        (np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat))
+    )
+
+
+def _inside_convex_vm(corners, points):
+    """
+    Tests if all points are inside the VM polygon, treating its edges as great circles
+    Each edge of a convex spherical polygon lies on a plane through the centre of the earth,
+    with the polygon entirely on one side of it
+    :param corners: An (n, 2) array of (lon, lat) corners of the VM, longitudes in [0, 360)
+    :param points: An (m, 2) array of (lon, lat) points to test
+    :return: True if the VM is convex and every point is at least CONVEX_VM_MARGIN inside every edge.
+    False if the VM is not convex or any point is near or outside its edges
+    """
+    # The point in polygon test compares longitudes directly, so points outside
+    # the corners' longitude range (e.g. across the antimeridian) must take that path
+    if np.any(points[:, 0] < corners[:, 0].min()) or np.any(
+        points[:, 0] > corners[:, 0].max()
+    ):
+        return False
+
+    corner_vectors = _ll_to_unit_vectors(corners)
+    normals = np.cross(corner_vectors, np.roll(corner_vectors, -1, axis=0))
+    normals /= np.linalg.norm(normals, axis=1)[:, np.newaxis]
+    # Orient the normals towards the inside of the polygon
+    corner_sides = corner_vectors @ normals.T
+    normals *= np.sign(corner_sides.sum(axis=0))[:, np.newaxis]
+
+    # Convex if no corner lies on the outside of any edge
+    if np.any(corner_vectors @ normals.T < -1e-12):
+        return False
+
+    return bool(
+        np.all(
+            _ll_to_unit_vectors(points) @ normals.T > np.sin(CONVEX_VM_MARGIN / R_EARTH)
+        )
+    )
+
+
+def _densify_vm_edges(corners):
+    """
+    Samples points along the great circle edges of the VM polygon, roughly one per km
+    :param corners: An (n, 2) array of (lon, lat) corners of the VM
+    :return: An (m, 2) array of (lon, lat) points along the edges, longitudes in [0, 360)
+    """
+    # Densify every edge at once: sample i of an edge with n samples lies at
+    # i / (n - 1) of the way along it, matching np.linspace per edge
+    ends = np.roll(corners, -1, axis=0)
+    n_samples = np.array(
+        [
+            int(max(ll_dist(*start_point, *end_point), 3))
+            for start_point, end_point in zip(corners, ends)
+        ]
+    )
+    offsets = np.concatenate(([0], np.cumsum(n_samples)))
+    edge_index = np.repeat(np.arange(len(corners)), n_samples)
+    fraction = (np.arange(offsets[-1]) - offsets[edge_index]) / (
+        n_samples[edge_index] - 1
+    )
+    edges = np.empty((offsets[-1], 2))
+    edges[:, 0] = (
+        corners[edge_index, 0]
+        + fraction * (ends[edge_index, 0] - corners[edge_index, 0])
+    ) % 360
+    for index, (start_point, end_point) in enumerate(zip(corners, ends)):
+        edge_slice = slice(offsets[index], offsets[index + 1])
+        edges[edge_slice, 1] = compute_intermediate_latitudes(
+            start_point, end_point, edges[edge_slice, 0]
+        )
+    return edges
+
+
+def _inside_densified_vm(corners, points):
+    """
+    Tests which points are inside the VM polygon, following its great circle edges with densely sampled straight lines
+    :param corners: An (n, 2) array of (lon, lat) corners of the VM, longitudes in [0, 360)
+    :param points: An (m, 2) array of (lon, lat) points to test
+    :return: A boolean array of length m, True for each point inside the VM
+    """
+    edges = _densify_vm_edges(corners)
+    path = mpltPath.Path(edges)
+
+    # Points outside the bounding box of the VM cannot be inside it,
+    # so only the remaining points need the full point in polygon test
+    edges_min, edges_max = edges.min(axis=0), edges.max(axis=0)
+    inside = np.all((points >= edges_min) & (points <= edges_max), axis=1)
+    if inside.any():
+        inside[inside] = path.contains_points(points[inside])
+    return inside
+
+
 def validate_vm_bounds(polygon, srf_bounds=None):
     """
     Validates the VM domain against the DEM and the srf bounds
-    :param polygon: A list of (lon, lat) tuples giving the corners of the VM
+    :param polygon: An array or list of (lon, lat) pairs giving the corners of the VM
     :param srf: A list of (lon, lat) tuples giving the corners of the VM. Not used if None
     :return: A list of error messages resulting from this validation
     """
     errors = []
 
-    for lon, lat in polygon:
-        if lon < MIN_LON or lon > MAX_LON or lat < MIN_LAT or lat > MAX_LAT:
-            errors.append(f"VM extents not contained within NZVM DEM: {lon}, {lat}")
+    corners = np.asarray(polygon, dtype=float)
+    out_of_bounds = (
+        (corners[:, 0] < MIN_LON)
+        | (corners[:, 0] > MAX_LON)
+        | (corners[:, 1] < MIN_LAT)
+        | (corners[:, 1] > MAX_LAT)
+    )
+    for lon, lat in corners[out_of_bounds].tolist():
+        errors.append(f"VM extents not contained within NZVM DEM: {lon}, {lat}")
     # Check SRF is within bounds of the VM if it is given
-    if srf_bounds is not None:
-        edges = []
-        for index, start_point in enumerate(polygon):
-            end_point = polygon[(index + 1) % len(polygon)]
-            lons = (
-                np.linspace(
-                    start_point[0],
-                    end_point[0],
-                    int(max(ll_dist(*start_point, *end_point), 3)),
-                )
-                % 360
-            )
-            lats = compute_intermediate_latitudes(start_point, end_point, lons)
-            edges.extend(list(zip(lons, lats)))
-        path = mpltPath.Path(edges)
-        for bounds in srf_bounds:
-            if not all(path.contains_points(bounds)):
-                errors.append("Srf extents not contained within velocity model corners")
+    if srf_bounds is not None and len(srf_bounds):
+        srf_points = np.concatenate(srf_bounds)[:, :2]
+        # For the usual convex VM the densified edges are only needed for SRFs near or over its edges
+        if not _inside_convex_vm(corners, srf_points):
+            inside = _inside_densified_vm(corners, srf_points)
+            # Split the per point result back into the planes of the srf
+            bounds_offsets = np.cumsum([0] + [len(bounds) for bounds in srf_bounds])
+            for start, end in zip(bounds_offsets[:-1], bounds_offsets[1:]):
+                if not inside[start:end].all():
+                    errors.append(
+                        "Srf extents not contained within velocity model corners"
+                    )
     return errors
 
 
 def validate_vm_file(file_name: Path, nx: int, ny: int, nz: int):
     """
-    Validates that a velocity model file has the correct size, and no 0 values in a sample of the layers
+    Validates that a velocity model file has the correct size, and no non-positive or NaN values
     :param file_name: A Path object representing the file to test
     :param nx, ny, nz: The size of the VM in grid spaces (nx*ny*nz)
     :return: A possibly empty list of issues with the VM file
     """
     errors = []
     vm_size = nx * ny * nz
-    size = file_name.stat().st_size
-    if size != vm_size * SIZE_FLOAT:
-        errors.append(
-            f"VM filesize for {file_name} expected: {vm_size * SIZE_FLOAT} found: {size}"
-        )
+    expected_size = vm_size * SIZE_FLOAT
+
+    # Scan the raw file in chunks read into a single reused buffer,
+    # stopping at the first chunk containing a non-positive or NaN value
+    buffer = np.empty(min(vm_size, SCAN_CHUNK_SIZE), dtype=DISK_DTYPE)
+    buffer_bytes = buffer.view(np.uint8)
+    with open(file_name, "rb") as vm_fp:
+        # Size the already open file rather than looking the path up again
+        size = os.fstat(vm_fp.fileno()).st_size
+        if size != expected_size:
+            errors.append(
+                f"VM filesize for {file_name} expected: {expected_size} found: {size}"
+            )
 
-    with VelocityModelFile(nx, ny, nz, file_name, writable=False, memmap=True) as vmf:
-        min_v = vmf.get_values().min()
-        if min_v <= 0.0:
-            errors.append(f"File {file_name} has minimum value of {min_v}")
+        # The file is read once front to back, so ask for aggressive readahead
+        # and drop the pages afterwards rather than leaving them in the page cache
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(vm_fp.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+        try:
+            # Only the first nx * ny * nz values are part of the model, any extra
+            # bytes are already reported by the size check
+            for start in range(0, vm_size, SCAN_CHUNK_SIZE):
+                chunk_bytes = min(SCAN_CHUNK_SIZE, vm_size - start) * SIZE_FLOAT
+                n_floats = vm_fp.readinto(buffer_bytes[:chunk_bytes]) // SIZE_FLOAT
+                if n_floats == 0:
+                    break
+                min_v = buffer[:n_floats].min()
+                # min propagates NaN, so this also catches NaN values
+                if not min_v > 0.0:
+                    errors.append(f"File {file_name} has minimum value of {min_v}")
+                    break
+        finally:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(vm_fp.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
 
     return errors
 
 
+def _positive_int(value: str):
+    """Argparse type for a strictly positive integer"""
+    int_value = int(value)
+    if int_value < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value}")
+    return int_value
+
+
 def main():
     parser = argparse.ArgumentParser()
 
@@ -257,10 +460,21 @@ def main():
     vm_file_parser = sub_parser.add_parser(
         NZVM_SUB_PARSER, help="Validate files generated by the NZVM"
     )
-    vm_file_parser.add_argument("vm_dir", type=Path, help="path the VM folder")
+    vm_file_parser.add_argument(
+        "vm_dir",
+        type=Path,
+        help="path the VM folder. With --jobs, may also be a folder of VM folders or a file listing one VM folder "
+        "(and optionally its srf) per line",
+    )
     vm_file_parser.add_argument(
         "srf", type=Path, help="Path to srf file", nargs="?", default=None
     )
+    vm_file_parser.add_argument(
+        "--jobs",
+        type=_positive_int,
+        help="Validate a batch of VMs using this many processes",
+        default=None,
+    )
 
     pert_parser = sub_parser.add_parser(
         SINGLE_FILE_SUB_PARSER,
@@ -273,6 +487,23 @@ def main():
 
     if args.subparser_name == PARAMS_SUB_PARSER:
         valid, error_message = validate_vm_params(args.vm_params, args.srf)
+    elif args.subparser_name == NZVM_SUB_PARSER and args.jobs is not None:
+        if args.srf is not None:
+            parser.error(
+                "srf cannot be given with --jobs, list srfs in the batch file instead"
+            )
+        if not args.vm_dir.exists():
+            parser.error(f"VM batch not found: {args.vm_dir}")
+        vm_dirs, srfs = _get_vm_batch(args.vm_dir)
+        if not vm_dirs:
+            parser.error(f"No VMs found to validate in {args.vm_dir}")
+        results = validate_many(vm_dirs, srfs, args.jobs)
+        valid = all(vm_valid for vm_valid, _ in results)
+        error_message = "\n".join(
+            f"{vm_dir}:\n{vm_error_message}"
+            for vm_dir, (vm_valid, vm_error_message) in zip(vm_dirs, results)
+            if not vm_valid
+        )
     elif args.subparser_name == NZVM_SUB_PARSER:
         valid, error_message = validate_vm_files(args.vm_dir, args.srf)
     elif args.subparser_name == SINGLE_FILE_SUB_PARSER: